@@ -0,0 +1,747 @@
+"""
+Shared plumbing for the Xcel Energy download scripts.
+
+Holds the configuration, Gigya login + SAML SSO flow and CSV helpers used by
+the downloaders, plus run_session(), which launches Chromium once, signs in
+once and then hands each capture task its own page in the same browser
+context.  A task is any callable taking (context, page, today); see
+xcel_download_elec_daily.scrape() for an example.
+
+Auth flow:
+  1. Log in via Gigya ScreenSets on my.xcelenergy.com
+  2. Navigate to the IDP-initiated SSO URL — Salesforce generates a SAMLResponse
+     server-side and posts it to myenergy's ACS, establishing the SimpleSAML
+     session (PHPSESSID + SimpleSAMLSessionID).
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import re
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterable, Sequence
+from contextlib import suppress
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import requests as _req
+from dotenv import load_dotenv
+from playwright.sync_api import (
+    Browser,
+    BrowserContext,
+    Page,
+    Playwright,
+    Request,
+    Route,
+    sync_playwright,
+    TimeoutError as PWTimeout,
+)
+from xcel_to_prom import generate_prom, PROM_DIR
+
+try:
+    import orjson as _json  # optional — several times faster than stdlib json
+except ImportError:
+    import json as _json
+
+try:
+    # optional — HTTP/2 lets parallel ajax fetches share one TLS connection
+    import h2  # noqa: F401  (required by httpx for http2=True)
+    import httpx
+except ImportError:
+    httpx = None
+
+# ── Configuration ─────────────────────────────────────────────────────────────
+
+load_dotenv()
+
+EMAIL    = os.getenv("XCEL_USERNAME")
+PASSWORD = os.getenv("XCEL_PASSWORD")
+
+# XCEL_DEBUG=1 saves a screenshot of the page when a step fails
+DEBUG = os.getenv("XCEL_DEBUG") == "1"
+
+# XCEL_LOW_MEMORY=1 runs Chromium as a single process (see CHROMIUM_ARGS)
+LOW_MEMORY = os.getenv("XCEL_LOW_MEMORY") == "1"
+
+# Where to save files
+OUTPUT_DIR = Path("./xcel_data")
+OUTPUT_DIR.mkdir(exist_ok=True)
+
+UA = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/122.0.0.0 Safari/537.36"
+)
+
+# ── URLs ──────────────────────────────────────────────────────────────────────
+
+LOGIN_URL = (
+    "https://my.xcelenergy.com/MyAccount/XE_Login"
+    "?template=XE_MA_Template&gig_client_id=JnU2RjC15thihnMDrOyzKzvH"
+)
+# Salesforce IDP-initiated SSO: generates a SAML assertion and posts it to
+# myenergy's ACS URL, establishing the SimpleSAML session.
+# app=0sp2R0000008OoM is the Salesforce Connected App ID for myenergy.
+IDP_SSO_URL       = "https://my.xcelenergy.com/MyAccount/idp/login?app=0sp2R0000008OoM"
+MYENERGY_BASE     = "https://myenergy.xcelenergy.com"
+USAGE_HISTORY_URL = f"{MYENERGY_BASE}/myenergy/usage-history"
+
+# Headless Chromium flags for a scraping run: no GPU, extensions or
+# background services competing with the pages we actually need.
+CHROMIUM_ARGS = [
+    "--disable-extensions",
+    "--disable-gpu",
+    "--disable-dev-shm-usage",
+    "--no-sandbox",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-sync",
+    "--disable-features=Translate,BackForwardCache,OptimizationHints,MediaRouter",
+    "--disable-blink-features=AutomationControlled",
+    "--disable-default-apps",
+    "--renderer-process-limit=2",
+    "--mute-audio",
+    "--no-first-run",
+    "--hide-scrollbars",
+]
+
+# Folding the browser, renderer and utility processes into one, with no
+# zygote, cuts resident memory on small hosts.  Chromium doesn't officially
+# support this mode, so it is opt-in rather than the default.
+if LOW_MEMORY:
+    CHROMIUM_ARGS += ["--single-process", "--no-zygote"]
+
+# Cookies + localStorage from the last successful SSO.  Reused while younger
+# than AUTH_STATE_MAX_AGE so most runs skip the login chain entirely.
+AUTH_STATE         = OUTPUT_DIR / ".auth.json"
+AUTH_STATE_MAX_AGE = 12 * 3600  # seconds
+
+# Transient backend errors are retried with exponential backoff (0.5, 1, 2,
+# 4 s) rather than failing the run and paying for a fresh login next time.
+FETCH_RETRIES  = 4
+FETCH_BACKOFF  = 0.5  # seconds, doubled after each attempt
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Write buffer for CSV output — large enough that a whole chart CSV is
+# flushed in one write() instead of one per 8 KiB.
+CSV_BUFFER = 1 << 20
+
+# Installed on every page via context.add_init_script so the scans are
+# compiled once per document rather than shipped with each evaluate() call.
+# The chart <select>s live inside Salesforce LWC shadow DOM, so one
+# iterative pass walks every shadow root, visiting each element once, and
+# collects all selects.  The list is cached on window.__xcelSelects and only
+# rebuilt when a lookup misses or a cached select has been re-rendered.
+# Rebuilds start from window.__xcelHost — the top-level element hosting the
+# last select found — and only walk the whole document if that misses.
+SHADOW_DOM_JS = """
+(() => {
+    function scan(root) {
+        const stack = [root], selects = [];
+        if (root.shadowRoot) stack.push(root.shadowRoot);
+        while (stack.length) {
+            for (const el of stack.pop().querySelectorAll('*')) {
+                if (el.tagName === 'SELECT') selects.push(el);
+                if (el.shadowRoot) stack.push(el.shadowRoot);
+            }
+        }
+        return (window.__xcelSelects = selects);
+    }
+
+    // Light-DOM ancestor whose shadow tree (transitively) contains el.
+    function hostOf(el) {
+        let node = el;
+        while (node.getRootNode() !== document) node = node.getRootNode().host;
+        return node;
+    }
+
+    function find(test) {
+        const cached = window.__xcelSelects;
+        if (cached && cached.every(s => s.isConnected)) {
+            const hit = cached.find(test);
+            if (hit) return hit;
+        }
+        const host = window.__xcelHost;
+        if (host && host.isConnected) {
+            const hit = scan(host).find(test);
+            if (hit) return hit;
+        }
+        const hit = scan(document).find(test);
+        if (hit) window.__xcelHost = hostOf(hit);
+        return hit || null;
+    }
+
+    function choose(sel, value) {
+        sel.value = value;
+        sel.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+
+    window.__xcelSelects = null;
+    window.__xcelHost    = null;
+
+    // Set select#timePeriod to value; false if the select isn't rendered.
+    window.__xcelSetTimePeriod = (value) => {
+        const sel = find(s => s.id === 'timePeriod');
+        if (!sel) return false;
+        choose(sel, value);
+        return true;
+    };
+
+    // Pick the "All Legacy Gas Meters" option in the Meter dropdown and
+    // return its label, or null if no select offers a gas meter.
+    const isGas = o => o.text.includes('Legacy Gas') || o.text.includes('Gas Meter');
+    window.__xcelSelectGasMeter = () => {
+        const sel = find(s => Array.from(s.options).some(isGas));
+        if (!sel) return null;
+        const opt = Array.from(sel.options).find(isGas);
+        choose(sel, opt.value);
+        return opt.text.trim();
+    };
+})();
+"""
+
+# Fills both Gigya credential fields in a single evaluate() instead of one
+# fill() round-trip each.  Only the live "instance" copies are touched, and
+# input/change events are dispatched so Gigya's own handlers see the values.
+# Returns false if either field is missing so the caller can fall back.
+_FILL_LOGIN_JS = """
+([email, password]) => {
+    const field = name => document.querySelector(
+        `input[data-screenset-roles='instance'][data-gigya-name='${name}']`);
+    const pairs = [[field('loginID'), email], [field('password'), password]];
+    if (pairs.some(([el]) => !el)) return false;
+    for (const [el, value] of pairs) {
+        el.focus();
+        el.value = value;
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+    }
+    return true;
+}
+"""
+
+# The captured ajax URL is server-generated, so a substitution is enough to
+# swap the usageType param — no need to parse and re-encode the query.
+_USAGE_TYPE = re.compile(r"([?&]usageType=)[^&]*")
+
+# Bill history dates arrive as MM/DD/YYYY (occasionally without zero padding)
+_BILL_DATE = re.compile(r"([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})")
+
+# A capture task: runs against a logged-in page and writes its own CSVs.
+Task = Callable[[BrowserContext, Page, datetime], None]
+
+
+class SessionExpired(RuntimeError):
+    """myenergy bounced us back to the login flow; the session is no longer valid."""
+
+
+class TasksFailed(RuntimeError):
+    """One or more tasks in a run_tasks() batch raised; the rest still ran."""
+
+    def __init__(self, failures: list[tuple[Task, Exception]]) -> None:
+        self.failed = [task for task, _ in failures]
+        super().__init__("; ".join(f"{task.__module__}: {e}" for task, e in failures))
+
+# ── Helpers ───────────────────────────────────────────────────────────────────
+
+# Nothing below is needed to capture the ajax URL — aborting it cuts page
+# weight and keeps trailing tracker requests from slowing navigation.
+# First-party stylesheets are let through so the LWC chart controls lay out
+# as they would in a normal session.
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+BLOCKED_HOSTS = re.compile(
+    r"googletagmanager|google-analytics|doubleclick|facebook|hotjar|newrelic"
+    r"|segment\.(?:io|com)|adobedtm|omtrdc|demdex|qualtrics"
+)
+
+
+def block_nonessential(route: Route) -> None:
+    """Route handler: abort images/fonts/media/third-party CSS and tracker hosts."""
+    req  = route.request
+    url  = req.url
+    kind = req.resource_type
+    if BLOCKED_HOSTS.search(url) or (
+        kind in BLOCKED_RESOURCE_TYPES
+        and not (kind == "stylesheet" and "xcelenergy" in url)
+    ):
+        route.abort()
+    else:
+        route.continue_()
+
+
+def debug_screenshot(page: Page, name: str) -> str:
+    """
+    Save a screenshot of page to OUTPUT_DIR/name when XCEL_DEBUG=1.
+    Returns a hint to append to the error message either way.
+    """
+    if not DEBUG:
+        return f"Re-run with XCEL_DEBUG=1 to save xcel_data/{name}."
+    page.screenshot(path=str(OUTPUT_DIR / name))
+    return f"Check xcel_data/{name}."
+
+
+def write_private(path: Path, data: str | bytes) -> None:
+    """
+    Write data to path readable by the owner only.  The file is created
+    0600 from the start (via a temp file renamed into place), so there is
+    no moment when other users can read it at umask permissions.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f"{path.name}.")
+    try:
+        try:
+            f = os.fdopen(fd, "wb")
+        except BaseException:
+            os.close(fd)
+            raise
+        with f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+
+
+def usage_ajax_request(time_period: str | None = None) -> Callable[[Request], bool]:
+    """
+    expect_request predicate matching the usage-history JSON call for
+    time_period (any time period when None).  Runs for every request while
+    waiting, so it does a single find() for the endpoint and only then looks
+    for the time period after it.
+    """
+    needle = f"timePeriod={time_period}" if time_period else ""
+
+    def match(req: Request) -> bool:
+        url = req.url
+        i   = url.find("usage-history-ajax/format/json")
+        return i != -1 and url.find(needle, i) != -1
+
+    return match
+
+
+def goto_myenergy(page: Page, url: str) -> None:
+    """
+    Navigate to a myenergy page, raising SessionExpired if the server
+    redirected us off myenergy (i.e. back into the login flow).
+    """
+    page.goto(url, wait_until="domcontentloaded", timeout=60_000)
+    if not page.url.startswith(MYENERGY_BASE):
+        raise SessionExpired(f"Redirected to {page.url} instead of {url}.")
+
+
+def _http_session(cookies: Iterable[dict], referer: str) -> _req.Session | httpx.Client:
+    """
+    Return an HTTP session carrying cookies (Playwright cookie dicts, kept
+    with their domain and path) and the browser's headers: an HTTP/2
+    httpx.Client when httpx[http2] is installed, else a requests Session.
+    Both are used only through .get() and as context managers.
+    """
+    headers = {"User-Agent": UA, "Referer": referer}
+    if httpx is not None:
+        session = httpx.Client(http2=True, headers=headers, timeout=30)
+    else:
+        session = _req.Session()
+        session.headers.update(headers)
+    for c in cookies:
+        session.cookies.set(c["name"], c["value"], domain=c["domain"], path=c["path"])
+    return session
+
+
+def new_session(context: BrowserContext, referer: str) -> _req.Session | httpx.Client:
+    """Return an HTTP session carrying the browser context's myenergy cookies."""
+    return _http_session(context.cookies([MYENERGY_BASE]), referer)
+
+
+def decode_json(body: bytes) -> dict:
+    """Decode a JSON response body — with orjson when it is installed."""
+    return _json.loads(body)
+
+
+def fetch_json(session: _req.Session | httpx.Client, url: str, what: str) -> dict:
+    """GET an ajax URL and decode the JSON body, retrying transient 5xx errors."""
+    for attempt in range(FETCH_RETRIES + 1):
+        r = session.get(url, timeout=30)
+        if r.status_code not in RETRY_STATUSES or attempt == FETCH_RETRIES:
+            break
+        delay = FETCH_BACKOFF * 2 ** attempt
+        print(f"  {what}: HTTP {r.status_code}, retrying in {delay:g}s...")
+        time.sleep(delay)
+    # requests follows the redirect to the login page, httpx returns the 3xx
+    if (
+        r.status_code in (401, 403)
+        or 300 <= r.status_code < 400
+        or not str(r.url).startswith(MYENERGY_BASE)
+    ):
+        raise SessionExpired(f"{what} request was rejected: HTTP {r.status_code}")
+    if r.status_code != 200:
+        raise RuntimeError(f"{what} request failed: HTTP {r.status_code}")
+    return decode_json(r.content)
+
+
+def fetch_json_many(session: _req.Session | httpx.Client, jobs: Sequence[tuple[str, str]]) -> list[dict]:
+    """
+    Fetch several (url, what) ajax requests concurrently on one session.
+    Returns the decoded bodies in the same order as jobs.
+    """
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(fetch_json, session, url, what) for url, what in jobs]
+        return [f.result() for f in futures]
+
+
+def swap_usage_type(url: str, usage_type: str) -> str:
+    """
+    Return url with usageType query param replaced by usage_type, or with
+    it appended if the captured URL doesn't carry one.
+    """
+    swapped, n = _USAGE_TYPE.subn(lambda m: m[1] + usage_type, url, count=1)
+    if n:
+        return swapped
+    return f"{url}{'&' if '?' in url else '?'}usageType={usage_type}"
+
+
+def _csv_name(name: str) -> str:
+    """Quote a header cell the way csv.writer's QUOTE_MINIMAL would."""
+    if any(c in name for c in ',"\r\n'):
+        return '"' + name.replace('"', '""') + '"'
+    return name
+
+
+def json_to_csv(data: dict, output_path: Path) -> int:
+    """Convert chart JSON response to CSV. Returns number of rows written."""
+    dates  = [d.partition(" ")[0] for d in data.get("column_fulldates", [])]
+    series = data.get("series_data", [])
+    if not dates or not series:
+        return 0
+    # Pad/trim every series to the date axis once, then work column-wise
+    n      = len(dates)
+    cols   = [(s["data"] + [0.0] * n)[:n] for s in series]
+    totals = [round(sum(v or 0.0 for v in vals), 3) for vals in zip(*cols)]
+    # Every cell is a date, a number or null, so rows are joined directly
+    # rather than run through csv.writer's per-cell quoting checks.  The
+    # output (CRLF line endings, null as an empty cell) matches csv.writer.
+    lines = [",".join(["Date", *(_csv_name(s["name"]) for s in series), "Total"])]
+    lines += [
+        ",".join(["" if v is None else str(v) for v in row])
+        for row in zip(dates, *cols, totals)
+    ]
+    output_path.write_bytes(("\r\n".join(lines) + "\r\n").encode("utf-8"))
+    return n
+
+
+def _bill_date(raw_date: str) -> str:
+    """Convert MM/DD/YYYY to YYYY-MM-DD; anything strptime rejects passes through."""
+    # Dates that are plainly valid skip strptime; the rest (day 29-31,
+    # out-of-range fields, odd formatting) get the exact strptime result.
+    m = _BILL_DATE.fullmatch(raw_date)
+    if m and 1 <= int(m[1]) <= 12 and 1 <= int(m[2]) <= 28 and int(m[3]) >= 1000:
+        return f"{m[3]}-{m[1].zfill(2)}-{m[2].zfill(2)}"
+    try:
+        return datetime.strptime(raw_date, "%m/%d/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return raw_date
+
+
+def bill_json_to_csv(data: dict, output_path: Path) -> int:
+    """
+    Parse the cost_barchart from the bill JSON and write to CSV.
+    Returns number of rows written.
+
+    CSV columns: Date, Electric Charges, Gas Charges, Total
+    Each row represents one billing cycle. Electric and gas are billed
+    on separate dates, so most rows have one $0 column.
+    """
+    chart   = data.get("cost_barchart", {})
+    cats    = chart.get("categories", [])    # ["MM/DD/YYYY", ...]
+    series  = chart.get("series_data", [])   # [{name, data}, ...]
+
+    if not cats or not series:
+        return 0
+
+    # Build a lookup: series name → values list, padded/trimmed to the dates
+    n = len(cats)
+    by_name: dict[str, list] = {s["name"]: s["data"] for s in series}
+    elec_vals  = (by_name.get("Electric Charges", []) + [0.0] * n)[:n]
+    gas_vals   = (by_name.get("Gas Charges",      []) + [0.0] * n)[:n]
+
+    rows = []
+    for raw_date, elec, gas in zip(cats, elec_vals, gas_vals):
+        # Only write rows that have a non-zero charge
+        if not (elec or gas):
+            continue
+        # Convert MM/DD/YYYY → YYYY-MM-DD for consistent sorting
+        total = round((elec or 0) + (gas or 0), 2)
+        rows.append([_bill_date(raw_date), elec or 0.0, gas or 0.0, total])
+
+    with output_path.open("w", newline="", encoding="utf-8", buffering=CSV_BUFFER) as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Electric Charges", "Gas Charges", "Total"])
+        writer.writerows(rows)
+    return len(rows)
+
+
+# ── Login + SSO ───────────────────────────────────────────────────────────────
+
+def login_and_sso(page: Page) -> None:
+    """Sign in via Gigya and complete the SAML SSO to myenergy.xcelenergy.com."""
+    # ── Step 1: Load the Gigya login page ─────────────────────────────────────
+    print("Step 1: Loading Xcel Energy login page...")
+    # The PKCE redirect chain (LOGIN_URL → CustomPKCEEndpoint →
+    # MyAccount_Proxy → login) is still running at domcontentloaded, so
+    # progress is gated on the login form itself below.
+    page.goto(LOGIN_URL, wait_until="domcontentloaded", timeout=60_000)
+
+    # Gigya keeps "template" copies of every field in the DOM alongside
+    # the live "instance" element. Wait for the instance.
+    login_id = page.locator("input[data-screenset-roles='instance'][data-gigya-name='loginID']")
+    password = page.locator("input[data-screenset-roles='instance'][data-gigya-name='password']")
+    submit   = page.locator("input[data-screenset-roles='instance'][type='submit']")
+    login_id.wait_for(state="attached", timeout=30_000)
+    print("  Login form ready.")
+
+    # ── Step 2: Fill credentials and submit ───────────────────────────────────
+    print("Step 2: Signing in...")
+    if not page.evaluate(_FILL_LOGIN_JS, [EMAIL, PASSWORD]):
+        login_id.fill(EMAIL)
+        password.fill(PASSWORD)
+    # A real click (not form.submit()) so Gigya's submit handler runs.
+    submit.click()
+
+    try:
+        page.wait_for_url(lambda url: "XE_Login" not in url, timeout=30_000)
+    except PWTimeout:
+        raise RuntimeError(
+            "Timed out waiting for post-login redirect. "
+            + debug_screenshot(page, "login_error.png")
+        )
+    print(f"  Logged in — now at: {page.url}")
+
+    # ── Step 3: IDP-initiated SAML SSO to myenergy.xcelenergy.com ────────────
+    # The "Visit My Energy" button links to IDP_SSO_URL.  Salesforce acts
+    # as the SAML IdP: it generates a SAMLResponse server-side and POSTs
+    # it to myenergy's ACS URL, setting SimpleSAMLSessionID + PHPSESSID
+    # without any direct TCP connection to wsservices.xcelenergy.com.
+    print("Step 3: IDP-initiated SAML SSO to myenergy.xcelenergy.com...")
+    page.goto(IDP_SSO_URL, wait_until="domcontentloaded", timeout=60_000)
+
+    try:
+        page.wait_for_url("**/myenergy.xcelenergy.com/**", timeout=60_000)
+    except PWTimeout:
+        raise RuntimeError(
+            "Failed to reach myenergy.xcelenergy.com after IDP SSO. "
+            + debug_screenshot(page, "sso_error.png")
+        )
+    print(f"  SSO complete — now at: {page.url}")
+
+
+# ── Saved session ─────────────────────────────────────────────────────────────
+
+def _auth_state_fresh() -> bool:
+    """True if a saved session exists and is younger than AUTH_STATE_MAX_AGE."""
+    try:
+        return time.time() - AUTH_STATE.stat().st_mtime < AUTH_STATE_MAX_AGE
+    except FileNotFoundError:
+        return False
+
+
+def _save_auth_state(context: BrowserContext) -> None:
+    """Persist the context's cookies; owner-only since they are live sessions."""
+    write_private(AUTH_STATE, _json.dumps(context.storage_state()))
+
+
+def saved_session(referer: str) -> _req.Session | httpx.Client | None:
+    """
+    Return an HTTP session seeded from the saved myenergy cookies, or None
+    if there is no fresh saved session.  Lets a caller that already knows
+    its ajax URL skip launching the browser altogether.
+    """
+    if not _auth_state_fresh():
+        return None
+    host = MYENERGY_BASE.split("//", 1)[1]
+    now  = time.time()
+    cookies = [
+        c for c in _json.loads(AUTH_STATE.read_bytes()).get("cookies", [])
+        if (host == c["domain"].lstrip(".") or host.endswith("." + c["domain"].lstrip(".")))
+        and (c.get("expires", -1) < 0 or c["expires"] > now)
+    ]
+    return _http_session(cookies, referer) if cookies else None
+
+
+# ── Runner ────────────────────────────────────────────────────────────────────
+
+def _new_context(browser: Browser, storage_state: Path | None = None) -> BrowserContext:
+    context = browser.new_context(user_agent=UA, storage_state=storage_state)
+    context.route("**/*", block_nonessential)
+    context.add_init_script(SHADOW_DOM_JS)
+    return context
+
+
+def _login(browser: Browser) -> BrowserContext:
+    """Return a fresh context signed in via Gigya + SAML SSO."""
+    context = _new_context(browser)
+    page    = context.new_page()
+    login_and_sso(page)
+    page.close()
+    _save_auth_state(context)
+    return context
+
+
+def _session_lost(page: Page, exc: Exception) -> bool:
+    """True if a task failed because myenergy sent it back to the login flow."""
+    return isinstance(exc, SessionExpired) or not page.url.startswith(MYENERGY_BASE)
+
+
+def _open_session(browser: Browser) -> tuple[BrowserContext, bool]:
+    """
+    Return a logged-in context and whether it came from the saved session.
+    A saved session is not checked up front: the first task to hit a login
+    redirect raises SessionExpired and run_session() logs in again.
+    """
+    if _auth_state_fresh():
+        print("Reusing saved session — skipping login.")
+        return _new_context(browser, storage_state=AUTH_STATE), True
+    return _login(browser), False
+
+
+def parse_args(description: str | None = None) -> argparse.Namespace:
+    """Command-line options shared by the download scripts."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--skip-prom", action="store_true",
+        help="don't regenerate the Prometheus textfile (e.g. when several "
+             "downloaders run back to back, followed by xcel_to_prom.py)",
+    )
+    return parser.parse_args()
+
+
+def launch_browser(p: Playwright) -> Browser:
+    """Launch headless Chromium with the slim CHROMIUM_ARGS flag set."""
+    return p.chromium.launch(
+        headless=True,
+        args=CHROMIUM_ARGS,
+        ignore_default_args=["--enable-automation"],
+        chromium_sandbox=False,
+    )
+
+
+def run_tasks(browser: Browser, tasks: Sequence[Task], today: datetime) -> None:
+    """
+    Log in once (or reuse the saved session), then run each task on its own
+    page in a shared context.  The context is closed afterwards; the browser
+    is left running for the caller.
+
+    A failing task doesn't stop the ones after it: every task runs, and
+    TasksFailed is raised at the end listing the ones that failed.  Only a
+    failed login aborts the batch.
+    """
+    failures: list[tuple[Task, Exception]] = []
+    context, reused = _open_session(browser)
+    try:
+        for task in tasks:
+            page = context.new_page()
+            try:
+                task(context, page, today)
+            except Exception as e:
+                if not (reused and _session_lost(page, e)):
+                    print(f"  {task.__module__} failed: {e}")
+                    failures.append((task, e))
+                    page.close()
+                    continue
+                print("  Saved session expired — logging in again.")
+                context.close()
+                AUTH_STATE.unlink(missing_ok=True)
+                context, reused = _login(browser), False
+                page = context.new_page()
+                try:
+                    task(context, page, today)
+                except Exception as e:
+                    print(f"  {task.__module__} failed: {e}")
+                    failures.append((task, e))
+            page.close()
+
+        # Refresh the saved cookies in case the server rotated them
+        if len(failures) < len(tasks):
+            _save_auth_state(context)
+    finally:
+        context.close()
+
+    if failures:
+        raise TasksFailed(failures)
+
+
+def write_prom_textfile(ondemand_rows: Sequence[tuple] | None = None) -> None:
+    """
+    Regenerate the Prometheus textfile from the CSVs in OUTPUT_DIR, using
+    ondemand_rows (if given) in place of the latest on-demand CSV.
+    """
+    print("Writing Prometheus textfile...")
+    prom_out, samples = generate_prom(
+        data_dir=OUTPUT_DIR, prom_dir=PROM_DIR, ondemand_rows=ondemand_rows,
+    )
+    print(f"  Saved {prom_out}  ({samples} samples)")
+
+
+def finish(
+    write_prom: bool = True,
+    pending: Future[None] | None = None,
+    ondemand_rows: Sequence[tuple] | None = None,
+) -> None:
+    """
+    Regenerate the Prometheus textfile (unless write_prom is False) and sign
+    off.  If the textfile is already being written in the background, wait
+    for that pending job instead of starting another.  ondemand_rows is
+    passed through to write_prom_textfile.
+    """
+    if not write_prom:
+        print("\nDone! (Prometheus textfile not regenerated)")
+        return
+
+    if pending is not None:
+        pending.result()
+    else:
+        write_prom_textfile(ondemand_rows)
+
+    print("\nDone!")
+
+
+def check_credentials() -> None:
+    """Exit with a hint if the login credentials are missing."""
+    if not EMAIL or not PASSWORD:
+        sys.exit("ERROR: Set XCEL_USERNAME and XCEL_PASSWORD in your .env file.")
+
+
+def run_session(tasks: Sequence[Task], write_prom: bool = True) -> None:
+    """
+    Launch Chromium once, log in once (or reuse the saved session), then run
+    each task on its own page in the shared context.  Regenerates the
+    Prometheus textfile at the end unless write_prom is False.  If some
+    tasks fail, the textfile is still regenerated from the CSVs the others
+    wrote before TasksFailed is re-raised.
+    """
+    check_credentials()
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pending = failed = None
+        with sync_playwright() as p:
+            browser = launch_browser(p)
+            try:
+                run_tasks(browser, tasks, datetime.today())
+            except TasksFailed as e:
+                failed = e
+            # Every CSV is on disk now, so rebuild the textfile while Chromium
+            # and the Playwright driver shut down.
+            if write_prom and (failed is None or len(failed.failed) < len(tasks)):
+                pending = pool.submit(write_prom_textfile)
+            browser.close()
+
+        if failed is not None:
+            if pending is not None:
+                pending.result()
+            raise failed
+        finish(write_prom, pending)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Xcel Energy Download Daemon — Playwright edition
+------------------------------------------------
+Long-running alternative to scheduling the downloaders from cron: Chromium
+is launched once and kept running, and each day at --hour the due captures
+run against a fresh browser context:
+
+  every day        xcel_download_elec_daily.py
+  1st of the month xcel_download_bill_history.py,
+                   xcel_download_elec_monthly.py,
+                   xcel_download_gas_monthly.py
+
+The Prometheus textfile is regenerated after every run.  Failures are
+logged and don't stop the other captures in the run.  A monthly capture
+that fails stays due and is retried with each daily run until it succeeds;
+the browser is relaunched if it has gone away.  Pass --once to run every
+capture immediately and exit (non-zero if any of them failed).
+
+Run it under systemd (Restart=always, optionally RuntimeMaxSec= to recycle
+the browser) or any other process supervisor.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import datetime, timedelta
+
+import xcel_download_bill_history as bill_history
+import xcel_download_elec_daily as elec_daily
+import xcel_download_elec_monthly as elec_monthly
+import xcel_download_gas_monthly as gas_monthly
+from playwright.sync_api import Browser, Playwright, sync_playwright
+from xcel_common import (
+    Task,
+    TasksFailed,
+    check_credentials,
+    launch_browser,
+    run_tasks,
+    write_prom_textfile,
+)
+
+DAILY_TASKS:   list[Task] = [elec_daily.scrape]
+MONTHLY_TASKS: list[Task] = [bill_history.scrape, elec_monthly.scrape, gas_monthly.scrape]
+
+
+def next_run(now: datetime, hour: int) -> datetime:
+    """Return the next time of day at hour:00 strictly after now."""
+    run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    return run if run > now else run + timedelta(days=1)
+
+
+def due_tasks(today: datetime, owed: list[Task]) -> list[Task]:
+    """
+    Captures to run on today's date: the daily ones, plus every monthly one
+    on the 1st and any monthly ones still owed from an earlier failed run.
+    """
+    return DAILY_TASKS + [t for t in MONTHLY_TASKS if today.day == 1 or t in owed]
+
+
+def run_once(
+    p: Playwright, browser: Browser, tasks: list[Task],
+) -> tuple[Browser, list[Task], bool]:
+    """
+    Run tasks on browser (relaunching it if needed) and refresh the .prom.
+    Returns the browser, the tasks that failed, and whether the whole run
+    (captures and textfile) succeeded.
+    """
+    if not browser.is_connected():
+        print("Browser went away — relaunching...")
+        browser = launch_browser(p)
+    today = datetime.today()
+    print(f"\n=== {today:%Y-%m-%d %H:%M} — running {len(tasks)} capture(s) ===")
+    failed: list[Task] = []
+    try:
+        run_tasks(browser, tasks, today)
+    except TasksFailed as e:
+        failed = e.failed
+        print(f"\nFailed: {e}")
+    except Exception as e:
+        failed = list(tasks)
+        print(f"\nFailed: {e}")
+
+    if len(failed) == len(tasks):
+        return browser, failed, False
+    try:
+        write_prom_textfile()
+    except Exception as e:
+        print(f"\nFailed: {e}")
+        return browser, failed, False
+    if not failed:
+        print("Done!")
+    return browser, failed, not failed
+
+
+def main(hour: int = 6, once: bool = False) -> None:
+    check_credentials()
+
+    with sync_playwright() as p:
+        browser = launch_browser(p)
+
+        if once:
+            browser, _, ok = run_once(p, browser, DAILY_TASKS + MONTHLY_TASKS)
+            browser.close()
+            if not ok:
+                sys.exit(1)
+            return
+
+        owed: list[Task] = []
+        while True:
+            when = next_run(datetime.now(), hour)
+            print(f"Next run at {when:%Y-%m-%d %H:%M}.")
+            time.sleep(max(0.0, (when - datetime.now()).total_seconds()))
+            tasks = due_tasks(when, owed)
+            browser, failed, _ = run_once(p, browser, tasks)
+            owed = [t for t in tasks if t in MONTHLY_TASKS and t in failed]
+            if owed:
+                print(f"Still owed: {', '.join(t.__module__ for t in owed)}.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--hour", type=int, default=6, choices=range(24), metavar="HOUR",
+        help="hour of day (0-23, local time) to run the captures (default: 6)",
+    )
+    parser.add_argument(
+        "--once", action="store_true",
+        help="run every capture now and exit instead of looping",
+    )
+    args = parser.parse_args()
+    try:
+        main(hour=args.hour, once=args.once)
+    except KeyboardInterrupt:
+        sys.exit(0)
+    except Exception as e:
+        print(f"\nFailed: {e}")
+        sys.exit(1)
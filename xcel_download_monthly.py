@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Xcel Energy Combined Monthly Downloader — Playwright edition
+------------------------------------------------------------
+Runs the electric monthly and gas monthly downloads in a single browser
+session: Chromium is launched once, the Gigya login + SAML SSO chain runs
+once, and each capture gets its own page in the shared context.  The
+Prometheus textfile is regenerated once at the end.
+
+Writes the same files as xcel_download_elec_monthly.py and
+xcel_download_gas_monthly.py.  Schedule this script instead of the two
+separate ones to halve the login cost per cron tick.  A failure in one
+capture doesn't stop the other: both run, the textfile is regenerated from
+whatever was written, and the script exits non-zero naming the failure.
+"""
+
+from __future__ import annotations
+
+import sys
+
+import xcel_download_elec_monthly as elec_monthly
+import xcel_download_gas_monthly as gas_monthly
+from xcel_common import parse_args, run_session
+
+
+def main(skip_prom: bool = False) -> None:
+    run_session([elec_monthly.scrape, gas_monthly.scrape], write_prom=not skip_prom)
+
+
+if __name__ == "__main__":
+    args = parse_args(__doc__.strip().splitlines()[0])
+    try:
+        main(skip_prom=args.skip_prom)
+    except Exception as e:
+        print(f"\nFailed: {e}")
+        sys.exit(1)
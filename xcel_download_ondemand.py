@@ -10,13 +10,17 @@ all 15-minute interval readings for the current day.  Captures the JSON
 response directly (no re-fetch required), converts to CSV, and regenerates
 the Prometheus textfile.
 
-Auth flow is identical to the other download scripts:
+Auth flow is identical to the other download scripts (see xcel_common.py):
   1. Log in via Gigya ScreenSets on my.xcelenergy.com
   2. IDP-initiated SAML SSO to myenergy.xcelenergy.com
   3. Navigate to usage-history — the page auto-fires odr-ajax.
   4. Parse intervals from the JSON response body.
 
-Schedule this script to run hourly via systemd timer.
+Schedule this script to run hourly via systemd timer.  The session saved
+in xcel_data/.auth.json is reused between runs, so most hourly runs skip
+steps 1-2 and go straight to usage-history.  Once a browser run has
+captured the day's odr-ajax URL, later runs that day replay it over plain
+HTTP with the saved cookies and don't launch Chromium at all.
 Files are saved to ./xcel_data/ with the date in the filename.
 Each run overwrites the current day's CSV so the prom file always reflects
 all intervals recorded so far today.
@@ -31,194 +35,238 @@ CSV columns: DateTime, kWh, rate_level, unix_ms
 from __future__ import annotations
 
 import csv
-import os
+import re
 import sys
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
 
-from dotenv import load_dotenv
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-from xcel_to_prom import generate_prom, PROM_DIR
-
-# ── Configuration ─────────────────────────────────────────────────────────────
-
-load_dotenv()
-
-EMAIL    = os.getenv("XCEL_USERNAME")
-PASSWORD = os.getenv("XCEL_PASSWORD")
-
-OUTPUT_DIR = Path("./xcel_data")
-OUTPUT_DIR.mkdir(exist_ok=True)
-
-UA = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/122.0.0.0 Safari/537.36"
+from playwright.sync_api import BrowserContext, Page, TimeoutError as PWTimeout
+from xcel_common import (
+    AUTH_STATE,
+    CSV_BUFFER,
+    OUTPUT_DIR,
+    SessionExpired,
+    USAGE_HISTORY_URL,
+    debug_screenshot,
+    decode_json,
+    fetch_json,
+    finish,
+    goto_myenergy,
+    parse_args,
+    run_session,
+    saved_session,
+    write_private,
 )
 
-# ── URLs ──────────────────────────────────────────────────────────────────────
+# odr-ajax URL captured by the last browser run.  Later runs on the same day
+# replay it with the saved session cookies instead of launching Chromium.
+ODR_URL_FILE = OUTPUT_DIR / ".odr_url"
 
-LOGIN_URL = (
-    "https://my.xcelenergy.com/MyAccount/XE_Login"
-    "?template=XE_MA_Template&gig_client_id=JnU2RjC15thihnMDrOyzKzvH"
-)
-IDP_SSO_URL       = "https://my.xcelenergy.com/MyAccount/idp/login?app=0sp2R0000008OoM"
-MYENERGY_BASE     = "https://myenergy.xcelenergy.com"
-USAGE_HISTORY_URL = f"{MYENERGY_BASE}/myenergy/usage-history"
+# odr-ajax interval timestamps, and the DateTime format written to the CSV
+_IN_FMT  = "%m/%d/%Y %I:%M %p"
+_OUT_FMT = "%Y-%m-%d %H:%M"
 
+# odr-ajax reports a stale session as an {"error": ...} body rather than an
+# HTTP status; errors mentioning any of these are treated as auth failures.
+_AUTH_ERROR = re.compile(
+    r"auth|session|log(?:ged)? ?in|sign(?:ed)? ?in|expired|unauthori[sz]ed|forbidden", re.I,
+)
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
 
 def parse_interval_datetime(ts: str) -> str:
     """Convert '2/26/2026 8:30 AM' to '2026-02-26 08:30'."""
+    # The feed always uses this fixed format, so split it by hand instead of
+    # running strptime + strftime per interval.  Anything the fast path isn't
+    # sure about (odd spacing, lowercase am/pm, day 29-31, ...) is left to
+    # strptime so the result is exactly the same.
+    try:
+        date, clock, ampm = ts.split(" ")
+        m, d, y = date.split("/")
+        h, mm   = clock.split(":")
+        if (
+            ampm in ("AM", "PM")
+            and ts.isascii() and (m + d + y + h + mm).isdigit()
+            and len(m) <= 2 and len(d) <= 2 and len(y) == 4
+            and len(h) <= 2 and len(mm) == 2
+        ):
+            month, day, year, hour = int(m), int(d), int(y), int(h)
+            if (
+                1 <= month <= 12 and 1 <= day <= 28 and year >= 1
+                and 1 <= hour <= 12 and int(mm) <= 59
+            ):
+                hour = hour % 12 + (12 if ampm == "PM" else 0)
+                return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{mm}"
+    except ValueError:
+        pass
+
     try:
-        return datetime.strptime(ts, "%m/%d/%Y %I:%M %p").strftime("%Y-%m-%d %H:%M")
+        return datetime.strptime(ts, _IN_FMT).strftime(_OUT_FMT)
     except ValueError:
         return ts
 
 
-def intervals_to_csv(intervals: list[dict], output_path: Path) -> int:
+def _interval_row(iv: dict) -> tuple | None:
+    """
+    (DateTime, kWh, rate_level, unix_ms) for one odr-ajax interval, or None
+    if it has no timestamp, no kWh or no server epoch.
+    """
+    ts_str = iv.get("last_request_timestamp")
+    unix_s = iv.get("last_request_unix_timestamp")
+    kwh    = iv.get("odr_amt")
+    # Intervals without the server's epoch are skipped rather than given one
+    # derived from local time, which could sort them out of order.
+    if not ts_str or unix_s is None or kwh is None:
+        return None
+    return (parse_interval_datetime(ts_str), kwh, iv.get("rate_level", ""), int(unix_s) * 1000)
+
+
+def intervals_to_csv(intervals: list[dict], output_path: Path) -> list[tuple]:
     """
     Write interval list from odr-ajax response to CSV.
     Intervals are sorted oldest-first.
-    Returns number of rows written.
+    Returns the rows written, as (DateTime, kWh, rate_level, unix_ms) tuples.
     """
-    rows = []
-    for iv in intervals:
-        ts_str = iv.get("last_request_timestamp", "")
-        unix_s = iv.get("last_request_unix_timestamp")
-        kwh    = iv.get("odr_amt")
-        rate   = iv.get("rate_level", "")
-        if ts_str and unix_s is not None and kwh is not None:
-            rows.append({
-                "DateTime":  parse_interval_datetime(ts_str),
-                "kWh":       kwh,
-                "rate_level": rate,
-                "unix_ms":   int(unix_s) * 1000,
-            })
-
-    # Sort oldest → newest so Prometheus sees chronological order
-    rows.sort(key=lambda r: r["unix_ms"])
-
-    with output_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["DateTime", "kWh", "rate_level", "unix_ms"])
-        writer.writeheader()
+    rows = [row for iv in intervals if (row := _interval_row(iv))]
+
+    # Sort oldest → newest (by unix_ms) so Prometheus sees chronological order.
+    # odr-ajax usually returns intervals in order already, so only sort when
+    # a pair is out of place.
+    if any(a[3] > b[3] for a, b in zip(rows, rows[1:])):
+        rows.sort(key=itemgetter(3))
+
+    with output_path.open("w", newline="", encoding="utf-8", buffering=CSV_BUFFER) as f:
+        writer = csv.writer(f)
+        writer.writerow(("DateTime", "kWh", "rate_level", "unix_ms"))
         writer.writerows(rows)
-    return len(rows)
+    return rows
 
 
-# ── Main ──────────────────────────────────────────────────────────────────────
+# ── Scrape ────────────────────────────────────────────────────────────────────
 
-def main() -> None:
-    if not EMAIL or not PASSWORD:
-        sys.exit("ERROR: Set XCEL_USERNAME and XCEL_PASSWORD in your .env file.")
-
-    today = datetime.today()
-
-    captured: dict[str, object] = {"odr_data": None}
-
-    def on_response(resp) -> None:
-        if "odr-ajax" in resp.url and captured["odr_data"] is None:
-            try:
-                captured["odr_data"] = resp.json()
-            except Exception:
-                pass
-
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(accept_downloads=True, user_agent=UA)
-        page    = context.new_page()
-        page.on("response", on_response)
-
-        # ── Step 1: Load the Gigya login page ─────────────────────────────────
-        print("Step 1: Loading Xcel Energy login page...")
-        page.goto(LOGIN_URL, wait_until="networkidle", timeout=60_000)
-        page.wait_for_selector(
-            "input[data-screenset-roles='instance'][data-gigya-name='loginID']",
-            state="attached", timeout=30_000,
+def scrape(context: BrowserContext, page: Page, today: datetime) -> None:
+    """Capture the odr-ajax response from usage-history and save the CSV."""
+    # ── Step 4: Load usage-history — odr-ajax fires automatically ─────────────
+    print("Step 4: Loading usage-history (triggers odr-ajax automatically)...")
+    # The wait is armed before navigating, so a response that completes while
+    # goto_myenergy is still running is caught rather than waited for again.
+    odr_data = odr_url = None
+    try:
+        with page.expect_response(lambda r: "odr-ajax" in r.url, timeout=60_000) as resp_info:
+            goto_myenergy(page, USAGE_HISTORY_URL)
+        resp = resp_info.value
+        odr_data = decode_json(resp.body())
+        if resp.request.method == "GET":
+            odr_url = resp.url
+    except PWTimeout:
+        pass
+    except ValueError:
+        # Not JSON (e.g. an HTML error page) — reported below
+        pass
+
+    if not odr_data:
+        raise RuntimeError(
+            "Did not capture odr-ajax response. "
+            "The page layout may have changed. "
+            + debug_screenshot(page, "ondemand_error.png")
         )
-        print("  Login form ready.")
-
-        # ── Step 2: Fill credentials and submit ───────────────────────────────
-        print("Step 2: Signing in...")
-        page.locator(
-            "input[data-screenset-roles='instance'][data-gigya-name='loginID']"
-        ).fill(EMAIL)
-        page.locator(
-            "input[data-screenset-roles='instance'][data-gigya-name='password']"
-        ).fill(PASSWORD)
-        page.locator(
-            "input[data-screenset-roles='instance'][type='submit']"
-        ).click()
-
-        try:
-            page.wait_for_url(lambda url: "XE_Login" not in url, timeout=30_000)
-        except PWTimeout:
-            page.screenshot(path=str(OUTPUT_DIR / "login_error.png"))
-            raise RuntimeError(
-                "Timed out waiting for post-login redirect. "
-                "Check xcel_data/login_error.png."
-            )
-        page.wait_for_load_state("networkidle", timeout=30_000)
-        print(f"  Logged in — now at: {page.url}")
-
-        # ── Step 3: IDP-initiated SAML SSO to myenergy.xcelenergy.com ────────
-        print("Step 3: IDP-initiated SAML SSO to myenergy.xcelenergy.com...")
-        page.goto(IDP_SSO_URL, wait_until="networkidle", timeout=60_000)
-
-        try:
-            page.wait_for_url("**/myenergy.xcelenergy.com/**", timeout=60_000)
-        except PWTimeout:
-            page.screenshot(path=str(OUTPUT_DIR / "sso_error.png"))
-            raise RuntimeError(
-                "Failed to reach myenergy.xcelenergy.com after IDP SSO. "
-                "Check xcel_data/sso_error.png."
-            )
-        page.wait_for_load_state("networkidle", timeout=30_000)
-        print(f"  SSO complete — now at: {page.url}")
-
-        # ── Step 4: Load usage-history — odr-ajax fires automatically ─────────
-        print("Step 4: Loading usage-history (triggers odr-ajax automatically)...")
-        page.goto(USAGE_HISTORY_URL, wait_until="networkidle", timeout=60_000)
-        page.wait_for_load_state("networkidle", timeout=30_000)
-
-        odr_data = captured["odr_data"]
-        if not odr_data:
-            page.screenshot(path=str(OUTPUT_DIR / "ondemand_error.png"))
-            raise RuntimeError(
-                "Did not capture odr-ajax response. "
-                "The page layout may have changed. "
-                "Check xcel_data/ondemand_error.png."
-            )
-
-        error = odr_data.get("error")
-        if error:
-            raise RuntimeError(f"odr-ajax returned error: {error}")
-
-        intervals = odr_data.get("intervals", [])
-        print(f"  Captured odr-ajax response ({len(intervals)} intervals).")
-
-        browser.close()
-
-    # ── Step 5: Write CSV ──────────────────────────────────────────────────────
+
+    error = odr_data.get("error")
+    if error:
+        # SessionExpired lets run_tasks log in again if the saved session
+        # was reused.
+        if _AUTH_ERROR.search(str(error)):
+            raise SessionExpired(f"odr-ajax rejected the session: {error}")
+        raise RuntimeError(f"odr-ajax returned error: {error}")
+
+    intervals = odr_data.get("intervals", [])
+    print(f"  Captured odr-ajax response ({len(intervals)} intervals).")
+
+    if odr_url:
+        write_private(ODR_URL_FILE, odr_url)
+
+    write_csv(intervals, today)
+
+
+def write_csv(intervals: list[dict], today: datetime) -> list[tuple]:
+    """
+    Write today's interval CSV (overwriting earlier runs from today) and
+    return its rows.
+    """
+    # ── Step 5: Write CSV ─────────────────────────────────────────────────────
     print("Step 5: Writing on-demand interval CSV...")
     csv_file = OUTPUT_DIR / f"ondemand_{today.strftime('%Y-%m-%d')}.csv"
     rows = intervals_to_csv(intervals, csv_file)
-    print(f"  Saved {csv_file.name} ({rows} intervals)")
+    print(f"  Saved {csv_file.name} ({len(rows)} intervals)")
+    return rows
+
+
+def fetch_direct(today: datetime) -> list[dict] | None:
+    """
+    Replay today's captured odr-ajax URL over plain HTTP with the saved
+    session cookies.  Returns the intervals, or None if the browser is
+    needed (no URL captured today, no fresh session, or the fetch failed).
+    """
+    try:
+        if datetime.fromtimestamp(ODR_URL_FILE.stat().st_mtime).date() != today.date():
+            return None
+    except FileNotFoundError:
+        return None
+    session = saved_session(USAGE_HISTORY_URL)
+    if session is None:
+        return None
+
+    # ── Step 4: Fetch odr-ajax directly with the saved session ────────────────
+    print("Step 4: Fetching odr-ajax with the saved session (no browser)...")
+    try:
+        with session:
+            odr_data = fetch_json(session, ODR_URL_FILE.read_text(encoding="utf-8"), "odr-ajax")
+    except SessionExpired as e:
+        # Drop the stale session so the browser run logs in from scratch
+        # instead of reusing it and failing the same way.
+        print(f"  Saved session rejected ({e}) — logging in again.")
+        AUTH_STATE.unlink(missing_ok=True)
+        return None
+    except Exception as e:
+        print(f"  Direct fetch failed ({e}) — falling back to the browser.")
+        return None
+    if not isinstance(odr_data, dict):
+        print("  odr-ajax returned an unexpected body — falling back to the browser.")
+        return None
+    error = odr_data.get("error")
+    if error:
+        if _AUTH_ERROR.search(str(error)):
+            print(f"  odr-ajax rejected the saved session ({error}) — logging in again.")
+            AUTH_STATE.unlink(missing_ok=True)
+        else:
+            print("  odr-ajax returned an error — falling back to the browser.")
+        return None
+
+    intervals = odr_data.get("intervals", [])
+    print(f"  Fetched odr-ajax response ({len(intervals)} intervals).")
+    return intervals
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
 
-    # ── Step 6: Regenerate Prometheus textfile ─────────────────────────────────
-    print("Step 6: Regenerating Prometheus textfile...")
-    prom_out = generate_prom(data_dir=OUTPUT_DIR, prom_dir=PROM_DIR)
-    text     = prom_out.read_text(encoding="utf-8")
-    samples  = sum(1 for ln in text.splitlines() if ln and not ln.startswith("#"))
-    print(f"  Saved {prom_out}  ({samples} samples)")
+def main(skip_prom: bool = False) -> None:
+    today     = datetime.today()
+    intervals = fetch_direct(today)
+    if intervals is None:
+        run_session([scrape], write_prom=not skip_prom)
+        return
 
-    print("\nDone!")
+    # The rows just written feed the textfile directly, so the CSV isn't
+    # read straight back.
+    rows = write_csv(intervals, today)
+    finish(write_prom=not skip_prom, ondemand_rows=rows)
 
 
 if __name__ == "__main__":
+    args = parse_args(__doc__.strip().splitlines()[0])
     try:
-        main()
+        main(skip_prom=args.skip_prom)
     except Exception as e:
         print(f"\nFailed: {e}")
         sys.exit(1)
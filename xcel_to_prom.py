@@ -36,6 +36,7 @@ from __future__ import annotations
 import csv
 import os
 import sys
+from collections.abc import Sequence
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -70,10 +71,16 @@ def _cleanup(pattern: str, directory: Path, keep: int) -> None:
 def generate_prom(
     data_dir: Path = DATA_DIR,
     prom_dir: Path = PROM_DIR,
-) -> Path:
+    ondemand_rows: Sequence[tuple] | None = None,
+) -> tuple[Path, int]:
     """
     Read the latest CSV files from data_dir and write xcel_energy.prom to
-    prom_dir.  Returns the path to the written .prom file.
+    prom_dir.  Returns the path to the written .prom file and the number of
+    samples (non-blank, non-comment lines) in it.
+
+    ondemand_rows, if given, are the on-demand rows just written to the
+    latest ondemand CSV — (DateTime, kWh, rate_level, unix_ms) tuples — and
+    are used as-is instead of reading that CSV back.
     """
     kwh_csv  = _latest("byday_kwh_*.csv",  data_dir)
     cost_csv = _latest("byday_cost_*.csv", data_dir)
@@ -237,19 +244,26 @@ def generate_prom(
     # node_exporter textfile collector rejects the whole file if any metric has
     # an explicit timestamp, so datetime is stored as a label instead.
     # Grafana displays these as a bar chart with xField="datetime".
-    if ondemand_csv:
+    if ondemand_rows is None and ondemand_csv:
+        with ondemand_csv.open(encoding="utf-8") as f:
+            ondemand_rows = [
+                (row["DateTime"], row["kWh"], row["rate_level"])
+                for row in csv.DictReader(f)
+            ]
+    if ondemand_rows is not None:
         lines += [
             "# HELP xcel_energy_ondemand_kwh"
             " On-demand 15-minute interval electricity usage in kWh",
             "# TYPE xcel_energy_ondemand_kwh gauge",
         ]
-        with ondemand_csv.open(encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                lines.append(
-                    f'xcel_energy_ondemand_kwh{{'
-                    f'datetime="{row["DateTime"]}",rate_level="{row["rate_level"]}"'
-                    f'}} {row["kWh"]}'
-                )
+        for when, kwh, rate, *_ in ondemand_rows:
+            # csv.writer writes None as an empty field; match it
+            rate = "" if rate is None else rate
+            lines.append(
+                f'xcel_energy_ondemand_kwh{{'
+                f'datetime="{when}",rate_level="{rate}"'
+                f'}} {kwh}'
+            )
         lines.append("")
 
     # ── Metadata ──────────────────────────────────────────────────────────────
@@ -264,6 +278,7 @@ def generate_prom(
     prom_dir.mkdir(parents=True, exist_ok=True)
     out = prom_dir / "xcel_energy.prom"
     out.write_text("\n".join(lines), encoding="utf-8")
+    samples = sum(1 for ln in lines if ln and ln[0] != "#")
 
     # ── Cleanup old CSVs ──────────────────────────────────────────────────────
     _cleanup("byday_kwh_*.csv",          data_dir, keep=3)
@@ -275,14 +290,12 @@ def generate_prom(
     _cleanup("bill_summary_*.csv",       data_dir, keep=3)
     _cleanup("ondemand_*.csv",           data_dir, keep=7)
 
-    return out
+    return out, samples
 
 
 if __name__ == "__main__":
     try:
-        out = generate_prom()
-        text = out.read_text(encoding="utf-8")
-        samples = sum(1 for l in text.splitlines() if l and not l.startswith("#"))
+        out, samples = generate_prom()
         print(f"Written: {out}  ({samples} samples)")
     except Exception as e:
         print(f"Failed: {e}", file=sys.stderr)